@@ -3,13 +3,45 @@ Q-learning agent for the gridworld environment.
 Written by: Rowan Rosenberg March 2025
 """
 
-import random
-import pickle
+import numpy as np
+from numba import njit
+
+# Q-values are stored as int32 fixed-point numbers with a resolution of 1 / Q_SCALE.
+Q_SCALE = 10000
+# alpha and gamma are applied as integer multipliers of 2**-FIXED_SHIFT.
+FIXED_SHIFT = 16
+
+def to_fixed(x):
+    """Convert a rate in [0, 1] to an integer multiplier of 2**-FIXED_SHIFT."""
+    return int(round(x * (1 << FIXED_SHIFT)))
+
+@njit(cache=True)
+def fixed_update(q, reward, max_next_Q, alpha_num, gamma_num):
+    """
+    Fixed-point Q-learning update on Q_SCALE-scaled integers (scalars or int64 arrays).
+    Returns q + alpha * (reward + gamma * max_next_Q - q), rounded to the nearest unit.
+    """
+    half = 1 << (FIXED_SHIFT - 1)
+    target = reward * Q_SCALE + ((gamma_num * max_next_Q + half) >> FIXED_SHIFT)
+    return q + ((alpha_num * (target - q) + half) >> FIXED_SHIFT)
+
+def encode(r, c, rc, state_shape):
+    """Pack a (row, col, reward_count) state into a single integer index."""
+    _, cols, n_rc = state_shape
+    return (r * cols + c) * n_rc + rc
+
+def decode(s, state_shape):
+    """Unpack an integer state index into (row, col, reward_count)."""
+    _, cols, n_rc = state_shape
+    s, rc = divmod(s, n_rc)
+    r, c = divmod(s, cols)
+    return r, c, rc
 
 class QLearningAgent:
-    def __init__(self, actions, alpha=0.1, gamma=0.9, epsilon=1.0, epsilon_decay=0.999, epsilon_min=0.001):
+    def __init__(self, actions, state_shape, alpha=0.1, gamma=0.9, epsilon=1.0, epsilon_decay=0.999, epsilon_min=0.001):
         """
         actions: list of possible actions (e.g., ['up', 'down', 'left', 'right'])
+        state_shape: tuple (rows, cols, n_rewards + 1) describing the state space
         alpha: learning rate
         gamma: discount factor
         epsilon: initial exploration rate
@@ -17,49 +49,102 @@ class QLearningAgent:
         epsilon_min: minimum exploration rate
         """
         self.actions = actions
+        self.action_index = {a: i for i, a in enumerate(actions)}
+        self.state_shape = tuple(state_shape)
         self.alpha = alpha
         self.gamma = gamma
+        self.alpha_num = to_fixed(alpha)
+        self.gamma_num = to_fixed(gamma)
         self.epsilon = epsilon
         self.epsilon_decay = epsilon_decay
         self.epsilon_min = epsilon_min
-        self.Q = {}
-
-    def _ensure_state(self, state):
-        """Initialize Q-values for unseen states."""
-        if state not in self.Q:
-            self.Q[state] = {a: 0.0 for a in self.actions}
-
-    def choose_action(self, state):
-        """ Choose an action using an epsilon-greedy strategy."""
-        self._ensure_state(state)
-        if random.random() < self.epsilon:
-            return random.choice(self.actions)
+        self.n_states = int(np.prod(self.state_shape))
+        # Fixed-point Q-table; divide by Q_SCALE for the real-valued estimates.
+        self.Q = np.zeros((self.n_states, len(actions)), dtype=np.int32)
+        self.rng = np.random.default_rng()
+        # Cache mapping a state index to the list of its best action indices.
+        self.best = {}
+
+    def _index(self, state):
+        """Encode a ((row, col), reward_count) state as a Q-table row index."""
+        (r, c), rc = state
+        return encode(r, c, rc, self.state_shape)
+
+    def _update_best(self, idx):
+        """Recompute and cache the best actions for a state index."""
+        row = self.Q[idx]
+        best = np.flatnonzero(row == row.max()).tolist()
+        self.best[idx] = best
+        return best
+
+    def clear_best(self):
+        """Discard the best-action cache after the Q-table is changed outside learn()."""
+        self.best = {}
+
+    def choose_action(self, state, eps_draw=None, rand_action=None):
+        """
+        Choose an action using an epsilon-greedy strategy.
+        eps_draw and rand_action may be supplied from pre-generated random arrays
+        (a uniform draw in [0, 1) and an action index) to avoid per-step RNG calls.
+        Ties between greedy actions are broken uniformly with a fresh draw, made only when a tie exists.
+        """
+        if eps_draw is None:
+            eps_draw = self.rng.random()
+        if eps_draw < self.epsilon:
+            if rand_action is None:
+                rand_action = self.rng.integers(len(self.actions))
+            return self.actions[rand_action]
         else:
-            # Return the action with the highest Q-value; if tie, select randomly.
-            max_value = max(self.Q[state].values())
-            best_actions = [action for action, value in self.Q[state].items() if value == max_value]
-            return random.choice(best_actions)
+            # Return the action with the highest Q-value; if tie, choose uniformly among the tied actions.
+            idx = self._index(state)
+            best = self.best.get(idx)
+            if best is None:
+                best = self._update_best(idx)
+            if len(best) == 1:
+                return self.actions[best[0]]
+            return self.actions[best[self.rng.integers(len(best))]]
 
     def learn(self, state, action, reward, next_state, done):
         """ Update the Q-table using the Q-learning update rule."""
-        self._ensure_state(state)
-        self._ensure_state(next_state)
-        current_Q = self.Q[state][action]
+        s = self._index(state)
+        a = self.action_index[action]
         # If the next state is terminal, there is no next Q-value.
-        max_next_Q = 0.0 if done else max(self.Q[next_state].values())
+        max_next_Q = 0 if done else int(self.Q[self._index(next_state)].max())
         # Q-learning update
-        self.Q[state][action] = current_Q + self.alpha * (reward + self.gamma * max_next_Q - current_Q)
+        self.Q[s, a] = fixed_update(int(self.Q[s, a]), int(reward), max_next_Q, self.alpha_num, self.gamma_num)
+        self._update_best(s)
+
+    def policy(self):
+        """Return the greedy action index for every encoded state (ties go to the first action)."""
+        return self.Q.argmax(axis=-1)
+
+    def values(self):
+        """Return the greedy state value max_a Q(s, a) for every encoded state."""
+        return self.Q.max(axis=-1) / Q_SCALE
 
     def update_epsilon(self):
         """Decay the exploration rate."""
         self.epsilon = max(self.epsilon_min, self.epsilon * self.epsilon_decay)
 
     def save(self, filename):
-        """Save the Q-table to a file using pickle."""
-        with open(filename, 'wb') as f:
-            pickle.dump(self.Q, f)
+        """Save the fixed-point Q-table and action names to a compressed .npz file."""
+        np.savez_compressed(filename, Q=self.Q, actions=np.array(self.actions))
 
     def load(self, filename):
-        """Load the Q-table from a file."""
-        with open(filename, 'rb') as f:
-            self.Q = pickle.load(f)
\ No newline at end of file
+        """
+        Load the Q-table from a .npz file.
+        Raises ValueError if the file was saved for a different state space or action list,
+        or holds a Q-table that is not in the int32 fixed-point format.
+        """
+        with np.load(filename) as data:
+            Q = data['Q']
+            actions = data['actions'].tolist()
+        if Q.dtype != np.int32:
+            raise ValueError(f"Q-table in {filename} has dtype {Q.dtype}, expected int32 fixed-point (scaled by {Q_SCALE})")
+        expected = (self.n_states, len(self.actions))
+        if Q.shape != expected:
+            raise ValueError(f"Q-table in {filename} has shape {Q.shape}, expected {expected}")
+        if actions != list(self.actions):
+            raise ValueError(f"Actions in {filename} are {actions}, expected {list(self.actions)}")
+        self.Q = Q
+        self.clear_best()
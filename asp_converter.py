@@ -4,56 +4,14 @@ The ASP representation can then be used to simulate the agent's behavior
 Written by: Rowan Rosenberg March 2025
 """
 
+import os
 import pickle
 from textwrap import dedent
+import numpy as np
+from agent import decode
 
-def load_data(filename):
-    #Load model and environment data from pickle file.
-    with open(filename, "rb") as f:
-        return pickle.load(f)
-
-def generate_asp(data, output_filename="asp_representation.lp", grid_size=(10, 10)):
-    #Generate ASP representation of gridworld and Q-table.
-    with open(output_filename, "w") as f:
-        Writer(f, grid_size).write_all(data)
-
-class Writer:
-    #Helper class for structured ASP generation
-    
-    def __init__(self, file, grid_size):
-        self.f = file
-        self.grid_size = grid_size
-        self.templates = {
-            'grid_size': "grid_size({0}, {1}).\n",
-            'wall': "wall({0}, {1}).\n",
-            'reward': "reward({0}, {1}, {2}).\n",
-            'q_value': "q_value({0}, {1}, {2}, {3}, {4}).\n"
-        }
-        
-    def write_all(self, data):
-        self._write_header()
-        self._write_walls(data["walls"])
-        self._write_rewards(data["rewards"])
-        self._write_movement_rules()
-        self._write_q_table(data["q_table"])
-        self._write_logic_rules()
-        self._write_user_section()
-        print(f"ASP representation exported to '{self.f.name}'")
-
-    def _write_header(self):
-        self.f.write("% Gridworld ASP Representation\n\n")
-        self.f.write(self.templates['grid_size'].format(*self.grid_size))
-
-    def _write_walls(self, walls):
-        self._write_section("Walls", (self.templates['wall'].format(*w) for w in walls))
-
-    def _write_rewards(self, rewards):
-        entries = (self.templates['reward'].format(i, *r) 
-                 for i, r in enumerate(rewards))
-        self._write_section("Rewards", entries)
-
-    def _write_movement_rules(self):
-        self.f.write(dedent('''
+#Static rule blocks, dedented once at import time.
+MOVEMENT_RULES = dedent('''
             % Grid structure and movement rules
             row(0..Rmax-1) :- grid_size(Rmax, _).
             col(0..Cmax-1) :- grid_size(_, Cmax).
@@ -72,36 +30,9 @@ class Writer:
             next_position(R, C, left,  R,   C-1) :- can_move(R, C, left).
             next_position(R, C, right, R,   C+1) :- can_move(R, C, right).
             next_position(R, C, A,     R,   C  ) :- row(R), col(C), action(A), not can_move(R, C, A).
-        ''').replace('            ', '') + '\n')
-
-    def _write_q_table(self, q_table):
-        #Write Q-table entries with correct position indexing
-        entries = (
-            self.templates['q_value'].format(
-                pos[0], pos[1], rc, act, int(round(val * 10000))  # scaled Q-value
-            )
-            for (pos, rc), actions in q_table.items()
-            for act, val in actions.items()
-        )
-        self._write_section("Q-table", entries)
+        ''').replace('            ', '') + '\n'
 
-    def _write_logic_rules(self):
-        self.f.write(dedent('''
-            % State logic
-            state(R, C, RC) :- q_value(R, C, RC, _, _).
-            
-            % Best action selection
-            max_q_value(R, C, RC, Max) :- 
-                state(R, C, RC), 
-                Max = #max { Q, A : q_value(R, C, RC, A, Q) }.
-            
-            best_action(R, C, RC, A) :- 
-                q_value(R, C, RC, A, Q), 
-                max_q_value(R, C, RC, Q).
-            
-            { chosen_action(R, C, RC, A) : best_action(R, C, RC, A) } = 1 :- 
-                state(R, C, RC).
-            
+LOGIC_RULES = dedent('''
             % State transitions
             next_state(Rnew, Cnew, RC + 1) :-
                 current_state(R, C, RC),
@@ -124,17 +55,112 @@ class Writer:
                 wall(Rtemp, Ctemp).
             
             #show next_state/3.
-        ''').replace('            ', '') + '\n')
+        ''').replace('            ', '') + '\n'
+
+def load_data(filename):
+    #Load model and environment data from pickle file.
+    with open(filename, "rb") as f:
+        return pickle.load(f)
+
+def generate_asp(data, output_filename="asp_representation.lp", grid_size=(10, 10)):
+    #Generate ASP representation of gridworld and Q-table.
+    #Build the whole program as ASCII bytes in memory and write it to disk with raw os.write calls.
+    buf = bytearray()
+    Writer(buf, grid_size).write_all(data)
+    fd = os.open(output_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(buf)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    print(f"ASP representation exported to '{output_filename}'")
+
+class Writer:
+    #Helper class for structured ASP generation
+    
+    def __init__(self, buf, grid_size):
+        self.buf = buf
+        self.grid_size = grid_size
+        self.templates = {
+            'grid_size': "grid_size({0}, {1}).\n",
+            'wall': "wall({0}, {1}).\n",
+            'reward': "reward({0}, {1}, {2}).\n",
+            'q_value': "q_value({0}, {1}, {2}, {3}, {4}).\n",
+            'chosen_action': "chosen_action({0}, {1}, {2}, {3})"
+        }
+        # Bound format methods, so per-entry formatting skips the dict and attribute lookups
+        self._fmt_grid_size = self.templates['grid_size'].format
+        self._fmt_wall = self.templates['wall'].format
+        self._fmt_reward = self.templates['reward'].format
+        self._fmt_q = self.templates['q_value'].format
+        self._fmt_chosen = self.templates['chosen_action'].format
+        
+    def write_all(self, data):
+        self._write_header()
+        self._write_walls(data["wall_mask"])
+        self._write_rewards(data["rewards"])
+        self._write_movement_rules()
+        self._write_q_table(data["q_table"], data["actions"], data["state_shape"])
+        self._write_chosen_actions(data["q_table"], data["actions"], data["state_shape"])
+        self._write_logic_rules()
+        self._write_user_section()
+
+    def _write_header(self):
+        self._write("% Gridworld ASP Representation\n\n")
+        self._write(self._fmt_grid_size(*self.grid_size))
+
+    def _write_walls(self, wall_mask):
+        self._write_section("Walls", (self._fmt_wall(*w) for w in np.argwhere(wall_mask)))
+
+    def _write_rewards(self, rewards):
+        entries = (self._fmt_reward(i, *r) 
+                 for i, r in enumerate(rewards))
+        self._write_section("Rewards", entries)
+
+    def _write_movement_rules(self):
+        self._write(MOVEMENT_RULES)
+
+    def _write_q_table(self, q_table, actions, state_shape):
+        #Write Q-table entries, decoding each state index back to its position
+        scaled = q_table.tolist()  # Q-values are already stored scaled by 10000
+        tpl = self._fmt_q
+        entries = [
+            tpl(*decode(s, state_shape), act, val)
+            for s, row in enumerate(scaled)
+            for act, val in zip(actions, row)
+        ]
+        self._write_section("Q-table", entries)
+
+    def _write_chosen_actions(self, q_table, actions, state_shape):
+        #Write the greedy action for each state as a fact; tied states get a choice rule over the tied actions
+        ties = (q_table == q_table.max(axis=-1, keepdims=True)).tolist()
+        tpl = self._fmt_chosen
+        entries = []
+        for s, tied in enumerate(ties):
+            pos = decode(s, state_shape)
+            options = [tpl(*pos, act) for act, t in zip(actions, tied) if t]
+            if len(options) == 1:
+                entries.append(options[0] + ".\n")
+            else:
+                entries.append("1 { " + "; ".join(options) + " } 1.\n")
+        self._write_section("Chosen actions", entries)
+
+    def _write_logic_rules(self):
+        self._write(LOGIC_RULES)
 
     def _write_user_section(self):
-        self.f.write("\n% ----------- User Configuration -----------\n")
-        self.f.write("% Update the initial state as needed:\n")
-        self.f.write("current_state(0, 0, 0).\n")
+        self._write("\n% ----------- User Configuration -----------\n")
+        self._write("% Update the initial state as needed:\n")
+        self._write("current_state(0, 0, 0).\n")
+
+    def _write(self, text):
+        self.buf.extend(text.encode('ascii'))
 
     def _write_section(self, title, entries):
-        self.f.write(f"\n% {title}\n")
-        self.f.writelines(entries)
-        self.f.write("\n")
+        self._write(f"\n% {title}\n")
+        self._write("".join(entries))
+        self._write("\n")
 
 def main():
     # Load the model and environment data from the pickle file.
@@ -1,12 +1,16 @@
 """
 Driver script for training a Q-learning agent to solve a gridworld problem.
-Options include training the agent, loading a trained model, rendering the model, printing the Q-table, and storing an environment/model combination.
+Subcommands: train (train the agent and save it), render (render a trained model), dump (print the Q-table) and export (store an environment/model combination).
+Example: python driver.py train --episodes 1000
 Written by: Rowan Rosenberg March 2025
 """
 
+import argparse
 import matplotlib.pyplot as plt
-from agent import QLearningAgent
-from gridworld import GridWorld
+import numpy as np
+from numba import njit
+from agent import QLearningAgent, decode, fixed_update, Q_SCALE
+from gridworld import GridWorld, _step_jit
 import pickle
 
 def create_environment():
@@ -14,38 +18,104 @@ def create_environment():
     walls = {(1, 2), (2, 1), (2, 2), (5, 0), (5, 2), (5, 3), (5, 4),
              (0, 6), (1, 6), (2, 6), (3, 6), (7, 2), (7, 3), (5, 7), (6, 7)}
     rewards = [(0, 8), (6, 3), (3, 3)]
-    return GridWorld(grid_size=(10, 10), walls=walls, rewards=rewards, start=(0, 0))
+    grid_size = (10, 10)
+    # Dense boolean wall mask for O(1) wall lookups.
+    wall_mask = np.zeros(grid_size, dtype=np.bool_)
+    wall_mask[tuple(zip(*walls))] = True
+    # GridWorld builds the (n_rewards, 2) reward position array itself, with its default dtype.
+    return GridWorld(grid_size=grid_size, walls=walls, rewards=rewards, start=(0, 0), wall_mask=wall_mask)
 
-def train_agent(num_episodes=500, max_steps=100):
+def state_shape(env):
+    # Q-table state dimensions: (rows, cols, number of rewards collected).
+    return (env.rows, env.cols, len(env.rewards) + 1)
+
+@njit(cache=True)
+def run_episode(Q, blocked_mask, reward_positions, start, alpha_num, gamma_num, epsilon, max_steps, eps_draws, rand_actions,
+                tie_draws):
+    """
+    Run one epsilon-greedy Q-learning episode entirely in compiled code, updating Q in place.
+    Q: (n_states, n_actions) fixed-point array indexed by the encoded state (see agent.encode);
+       actions are ordered up, down, left, right
+    alpha_num, gamma_num: learning rate and discount as fixed-point multipliers (see agent.to_fixed)
+    blocked_mask: (rows + 2, cols + 2) boolean wall mask with a blocked border (see GridWorld.blocked_mask)
+    reward_positions: (n_rewards, 2) integer array of reward squares in collection order
+    start: (row, col) starting position
+    eps_draws, rand_actions: pre-generated uniform draws and random action indices, one per step
+    tie_draws: pre-generated uniform draws in [0, 1), one per step, used to pick among tied greedy actions
+    Returns the total reward collected.
+    """
+    cols = blocked_mask.shape[1] - 2
+    n_rewards = reward_positions.shape[0]
+    n_rc = n_rewards + 1
+    n_actions = Q.shape[-1]
+    r, c = start
+    rc = 0
+    s = (r * cols + c) * n_rc + rc
+    total_reward = 0
+    for step in range(max_steps):
+        # Epsilon-greedy selection; ties between greedy actions are broken uniformly at random.
+        a = rand_actions[step]
+        if eps_draws[step] >= epsilon:
+            best = Q[s, 0]
+            n_best = 0
+            for i in range(n_actions):
+                if Q[s, i] > best:
+                    best = Q[s, i]
+                    n_best = 1
+                elif Q[s, i] == best:
+                    n_best += 1
+            pick = int(tie_draws[step] * n_best)
+            for i in range(n_actions):
+                if Q[s, i] == best:
+                    if pick == 0:
+                        a = i
+                        break
+                    pick -= 1
+
+        # Move and collect the current target reward.
+        new_r, new_c, reward, new_rc, done = _step_jit(r, c, a, blocked_mask, reward_positions, rc)
+        new_s = (new_r * cols + new_c) * n_rc + new_rc
+
+        # Q-learning update; terminal states have no next Q-value.
+        max_next_Q = 0
+        if not done:
+            max_next_Q = Q[new_s].max()
+        Q[s, a] = fixed_update(np.int64(Q[s, a]), reward, np.int64(max_next_Q), alpha_num, gamma_num)
+
+        r, c, rc, s = new_r, new_c, new_rc, new_s
+        total_reward += reward
+        if done:
+            break
+    return total_reward
+
+def train_agent(num_episodes=500, max_steps=100, env=None):
     actions = ['up', 'down', 'left', 'right']
-    agent = QLearningAgent(actions)
+    if env is None:
+        env = create_environment()
+    agent = QLearningAgent(actions, state_shape(env))
+
+    rng = np.random.default_rng()
 
-    env = create_environment()
-    
     for episode in range(num_episodes):
-        state = env.reset()
-        total_reward = 0
-        for step in range(max_steps):
-            action = agent.choose_action(state)
-            next_state, reward, done = env.step(action)
-            agent.learn(state, action, reward, next_state, done)
-            state = next_state
-            total_reward += reward
-            if done:
-                break
+        # Draw the episode's exploration randomness up front.
+        eps_draws = rng.random(max_steps)
+        rand_actions = rng.integers(0, len(actions), max_steps)
+        tie_draws = rng.random(max_steps)
+        total_reward = run_episode(agent.Q, env.blocked_mask, env.reward_rc, env.start, agent.alpha_num,
+                                   agent.gamma_num, agent.epsilon, max_steps, eps_draws, rand_actions, tie_draws)
         agent.update_epsilon()
         print(f"Episode {episode + 1}/{num_episodes} - Total Reward: {total_reward} - Epsilon: {agent.epsilon:.3f}")
+    # The compiled loop updates the Q-table in place, bypassing the agent's best-action cache.
+    agent.clear_best()
     return agent
 
-def render_trained_model(model_filename="q_learning_model.pkl", max_steps=100, delay=0.5):
-    actions = ['up', 'down', 'left', 'right']
-    # Load the trained agent.
-    agent = QLearningAgent(actions)
-    agent.load(model_filename)
+def render_trained_model(agent, env=None, max_steps=100, delay=0.5):
+    # Renders a greedy rollout of an already trained (or loaded) agent.
+    if env is None:
+        env = create_environment()
     # Set epsilon to 0 for purely greedy behavior.
     agent.epsilon = 0.0
 
-    env = create_environment()
     state = env.reset()
     
     # Set up interactive mode and create a non-blocking plot window.
@@ -59,10 +129,12 @@ def render_trained_model(model_filename="q_learning_model.pkl", max_steps=100, d
     print("Running the trained model:")
     while not done and step < max_steps:
         action = agent.choose_action(state)
-        state, reward, done = env.step(action)
+        state, reward, done = env.step(agent.action_index[action])
         print(f"Step {step+1}: Action = {action}, State = {state}, Reward = {reward}, Done = {done}")
         env.render_plot(ax)
-        plt.pause(delay)  
+        # Wait while still pumping GUI events; a zero timeout would mean "wait forever" here.
+        if delay > 0:
+            fig.canvas.start_event_loop(delay)
         step += 1
 
     plt.ioff()
@@ -70,17 +142,20 @@ def render_trained_model(model_filename="q_learning_model.pkl", max_steps=100, d
 
 def print_q_table(agent):
     print("Q-table contents:")
-    for state, action_values in agent.Q.items():
-        print(f"State {state}:")
-        for action, q_value in action_values.items():
-            print(f"  {action}: {q_value:.4f}")
+    for s, action_values in enumerate(agent.Q):
+        r, c, rc = decode(s, agent.state_shape)
+        print(f"State {((r, c), rc)}:")
+        for action, q_value in zip(agent.actions, action_values):
+            print(f"  {action}: {q_value / Q_SCALE:.4f}")
     print()
 
 def export_environment_and_q_table(agent, env, filename="exported_model.pkl"):
-    # Prepare export data; converting walls to list
+    # Prepare export data
     export_data = {
-        "walls": list(env.walls),
+        "wall_mask": env.wall_mask,
         "rewards": env.rewards,
+        "actions": agent.actions,
+        "state_shape": agent.state_shape,
         "q_table": agent.Q
     }
     
@@ -90,46 +165,43 @@ def export_environment_and_q_table(agent, env, filename="exported_model.pkl"):
     
     print(f"Environment and Q-table exported to {filename}")
 
+def load_agent(path, shape):
+    # Builds an agent for the given state shape and loads the saved model into it.
+    agent = QLearningAgent(actions=['up', 'down', 'left', 'right'], state_shape=shape)
+    agent.load(path)
+    return agent
+
 def main():
+    parser = argparse.ArgumentParser(description="Train, render, inspect or export a Q-learning gridworld agent.")
+    parser.add_argument("--model", default="q_learning_model.npz", help="model file to save to or load from")
+    subparsers = parser.add_subparsers(dest="command", required=True)
 
-    model_filename = "q_learning_model.pkl"
-    exit = False
-    
-    while not exit:
-
-        action = input("Choose an option: \n 1. Train the agent and save \n 2. Load the trained model and render it \n 3. Print the model Q-table \n 4. Export environment and Q-table \n 5. Exit \n")
-
-        if action == "1":
-            # Train the agent.
-            episodes = int(input("Enter the number of episodes to train (1000 is appropriate): "))
-            trained_agent = train_agent(num_episodes=episodes, max_steps=100)
-            # Save the Q-learning model to a file.
-            trained_agent.save(model_filename)
-            print(f"Trained model saved to {model_filename}")
-        elif action == "2":
-            # Load the trained model from the file.
-            loaded_agent = QLearningAgent(actions=['up', 'down', 'left', 'right'])
-            loaded_agent.load(model_filename)
-            render_trained_model(model_filename)
-        elif action == "3":
-            # Load the trained model from the file.
-            loaded_agent = QLearningAgent(actions=['up', 'down', 'left', 'right'])
-            loaded_agent.load(model_filename)
-            # Print the Q-table of the trained agent.
-            print_q_table(loaded_agent)
-        elif action == "4":
-            # Create the environment instance
-            env = create_environment()
-            # Load the trained model from the file.
-            loaded_agent = QLearningAgent(actions=['up', 'down', 'left', 'right'])
-            loaded_agent.load(model_filename)
-            # Save the Q-table and environment
-            export_environment_and_q_table(trained_agent, env, filename="env_and_model.pkl")
-        elif action == "5":
-            exit = True
-        else:
-            print("Invalid option. Please try again.")
-        
+    train_parser = subparsers.add_parser("train", help="train the agent and save it")
+    train_parser.add_argument("--episodes", type=int, default=1000, help="number of training episodes")
+    train_parser.add_argument("--max-steps", type=int, default=100, help="maximum steps per episode")
+
+    render_parser = subparsers.add_parser("render", help="load the trained model and render it")
+    render_parser.add_argument("--delay", type=float, default=0.5, help="seconds between rendered steps")
+
+    subparsers.add_parser("dump", help="print the model Q-table")
+
+    export_parser = subparsers.add_parser("export", help="export the environment and Q-table")
+    export_parser.add_argument("--output", default="env_and_model.pkl", help="export file name")
+
+    args = parser.parse_args()
+    env = create_environment()
+
+    if args.command == "train":
+        trained_agent = train_agent(num_episodes=args.episodes, max_steps=args.max_steps, env=env)
+        # Save the Q-learning model to a file.
+        trained_agent.save(args.model)
+        print(f"Trained model saved to {args.model}")
+    elif args.command == "render":
+        render_trained_model(load_agent(args.model, state_shape(env)), env, delay=args.delay)
+    elif args.command == "dump":
+        print_q_table(load_agent(args.model, state_shape(env)))
+    elif args.command == "export":
+        export_environment_and_q_table(load_agent(args.model, state_shape(env)), env, filename=args.output)
 
 if __name__ == "__main__":
     main()
@@ -4,96 +4,442 @@ The main function allows for testing the environment.
 Written by: Rowan Rosenberg March 2025
 """
 
+import argparse
+import functools
+import sys
+from enum import IntEnum
 import numpy as np
 import matplotlib.pyplot as plt
+from numba import njit, prange
+
+class Action(IntEnum):
+    UP = 0
+    DOWN = 1
+    LEFT = 2
+    RIGHT = 3
+
+# Keyboard names for the actions; input is validated here, not in step.
+_STR2ACT = {a.name.lower(): a for a in Action}
+# Single-key controls for interactive play.
+_KEY2ACT = {'w': Action.UP, 's': Action.DOWN, 'a': Action.LEFT, 'd': Action.RIGHT}
+
+# (row, col) offsets indexed by Action.
+_DELTAS = np.array([[-1, 0], [1, 0], [0, -1], [0, 1]], dtype=np.int8)
+
+# Reward cell colors by status: already collected (gray), current target (light green), future (light blue).
+_REWARD_COLORS = np.array([[0.8, 0.8, 0.8], [0.6, 1.0, 0.6], [0.6, 0.6, 1.0]])
+
+def pack_states(positions, current_rewards):
+    """
+    Packs (n, 2) positions and (n,) reward counts into uint32 states r<<24 | c<<16 | k.
+    Rows and columns get 8 bits and the reward count 16, so packing is limited to small grids:
+    raises ValueError for a row or column above 255 or a reward count above 0xFFFF.
+    """
+    positions = np.asarray(positions)
+    current_rewards = np.asarray(current_rewards)
+    if positions.size and (positions.min() < 0 or positions.max() > 0xFF):
+        raise ValueError("packed states need rows and columns in 0..255")
+    if current_rewards.size and (current_rewards.min() < 0 or current_rewards.max() > 0xFFFF):
+        raise ValueError("packed states need reward counts in 0..65535")
+    positions = positions.astype(np.uint32)
+    return (positions[:, 0] << 24) | (positions[:, 1] << 16) | current_rewards.astype(np.uint32)
+
+def unpack_states(states):
+    """Inverse of pack_states: returns (positions, current_rewards) as int32 arrays."""
+    states = np.asarray(states, dtype=np.uint32)
+    positions = np.stack(((states >> 24), (states >> 16) & 0xFF), axis=1).astype(np.int32)
+    return positions, (states & 0xFFFF).astype(np.int32)
+
+def _check_actions(actions):
+    """Returns actions as an array, raising IndexError if any code is not a valid Action."""
+    actions = np.asarray(actions)
+    if actions.size and (actions.min() < 0 or actions.max() >= len(Action)):
+        raise IndexError(f"action codes must be in 0..{len(Action) - 1}")
+    return actions
+
+def _transition(r, c, action, blocked_mask, reward_rc, current_reward):
+    """
+    Gridworld transition on plain integers and arrays, compiled for the CPU as _step_jit and as a
+    CUDA device function in gridworld_cuda, so both share one definition.
+    blocked_mask: (rows + 2, cols + 2) boolean array of walls with a blocked border (see GridWorld.blocked_mask)
+    reward_rc: (n_rewards, 2) reward positions in collection order
+    Returns: (new_r, new_c, reward, new_current_reward, done)
+    action must be in 0..3; it is not checked here (callers validate once, see _check_actions).
+    """
+    new_r = r + _DELTAS[action, 0]
+    new_c = c + _DELTAS[action, 1]
+    # Stay in place when leaving the grid or walking into a wall; the border makes this one lookup.
+    if blocked_mask[new_r + 1, new_c + 1]:
+        new_r, new_c = r, c
+    n_rewards = reward_rc.shape[0]
+    reward = 0
+    # Once every reward is collected there is no target left to compare against.
+    if current_reward < n_rewards and new_r == reward_rc[current_reward, 0] and new_c == reward_rc[current_reward, 1]:
+        reward = 1
+        current_reward += 1
+    done = current_reward >= n_rewards
+    return new_r, new_c, reward, current_reward, done
+
+_step_jit = njit(cache=True, nogil=True)(_transition)
+
+# Source template for a step function specialized to one grid; see _specialized_step.
+_STEP_TEMPLATE = '''
+def step_spec(r, c, action, current_reward):
+    if action == 0:
+        new_r, new_c = r - 1, c
+    elif action == 1:
+        new_r, new_c = r + 1, c
+    elif action == 2:
+        new_r, new_c = r, c - 1
+    elif action == 3:
+        new_r, new_c = r, c + 1
+    else:
+        raise IndexError("action out of range")
+    if new_r < 0 or new_r >= {rows} or new_c < 0 or new_c >= {cols} or W[new_r, new_c]:
+        new_r, new_c = r, c
+    reward = 0
+    if current_reward < {n_rewards} and new_r == R[current_reward, 0] and new_c == R[current_reward, 1]:
+        reward = 1
+        current_reward += 1
+    return new_r, new_c, reward, current_reward, current_reward >= {n_rewards}
+'''
+
+def _specialized_step(wall_mask, reward_rc):
+    """
+    Returns a compiled step(r, c, action, current_reward) with the grid size and reward count baked in
+    as literals and the wall mask and reward positions frozen as constants. Same results as _step_jit.
+    """
+    reward_rc = np.ascontiguousarray(reward_rc)
+    return _compile_step(wall_mask.shape, np.asarray(wall_mask, dtype=np.bool_).tobytes(),
+                         reward_rc.dtype.str, reward_rc.shape, reward_rc.tobytes())
+
+# Bounded, so sweeping over many grids does not keep every compiled function alive.
+@functools.lru_cache(maxsize=32)
+def _compile_step(shape, wall_bytes, rc_dtype, rc_shape, rc_bytes):
+    """Generates and compiles the specialized step for one grid configuration (see _specialized_step)."""
+    rows, cols = shape
+    namespace = {'W': np.frombuffer(wall_bytes, dtype=np.bool_).reshape(shape).copy(),
+                 'R': np.frombuffer(rc_bytes, dtype=rc_dtype).reshape(rc_shape).copy()}
+    exec(_STEP_TEMPLATE.format(rows=rows, cols=cols, n_rewards=rc_shape[0]), namespace)
+    # Generated code has no source file, so it cannot use numba's on-disk cache.
+    return njit(nogil=True)(namespace['step_spec'])
+
+@njit(cache=True, nogil=True)
+def _rollout_jit(r, c, current_reward, actions, blocked_mask, reward_rc, out):
+    """
+    Applies a sequence of actions in one compiled call, stopping early when the episode ends.
+    Row t of out (shape (len(actions), 5), int32) receives (r, c, current_reward, reward, done) after step t.
+    Returns the number of steps taken.
+    """
+    for t in range(actions.shape[0]):
+        r, c, reward, current_reward, done = _step_jit(r, c, actions[t], blocked_mask, reward_rc, current_reward)
+        out[t, 0] = r
+        out[t, 1] = c
+        out[t, 2] = current_reward
+        out[t, 3] = reward
+        out[t, 4] = done
+        if done:
+            return t + 1
+    return actions.shape[0]
+
+@njit(cache=True, parallel=True)
+def rollout_many(positions, current_rewards, actions_TK, blocked_mask, reward_rc, rewards_out, dones_out):
+    """
+    Rolls out K independent environments for T steps each, in parallel across environments.
+    positions: (K, 2) and current_rewards: (K,) integer arrays, updated in place
+    actions_TK: (T, K) action codes; rewards_out and dones_out: (T, K) arrays filled per step
+    Finished environments stay put, collecting no further reward and reporting done.
+    """
+    T, K = actions_TK.shape
+    n_rewards = reward_rc.shape[0]
+    for k in prange(K):
+        r = positions[k, 0]
+        c = positions[k, 1]
+        current_reward = current_rewards[k]
+        for t in range(T):
+            if current_reward >= n_rewards:
+                rewards_out[t, k] = 0
+                dones_out[t, k] = True
+                continue
+            r, c, reward, current_reward, done = _step_jit(r, c, actions_TK[t, k], blocked_mask, reward_rc,
+                                                           current_reward)
+            rewards_out[t, k] = reward
+            dones_out[t, k] = done
+        positions[k, 0] = r
+        positions[k, 1] = c
+        current_rewards[k] = current_reward
 
 class GridWorld:
-    def __init__(self, grid_size=(10, 10), walls=None, rewards=None, start=(0, 0)):
+    _DELTAS = _DELTAS
+
+    def __init__(self, grid_size=(10, 10), walls=None, rewards=None, start=(0, 0), wall_mask=None, reward_rc=None):
         """
         grid_size: tuple (rows, cols)
         walls: set of (row, col) positions that are walls
+        wall_mask: optional (rows, cols) boolean array marking walls; built from walls if omitted
         rewards: ordered list mapping (row, col) positions to reward values
+        reward_rc: optional (n_rewards, 2) integer array of the reward positions; built from rewards if omitted
         terminals: set of (row, col) positions where the episode terminates
         start: starting (row, col) position of the agent
         """
         self.rows, self.cols = grid_size
+        # The boolean wall mask is what stepping and rendering test against.
+        if wall_mask is None:
+            wall_mask = np.zeros((self.rows, self.cols), dtype=np.bool_)
+            for (r, c) in (walls if walls is not None else ()):
+                wall_mask[r, c] = True
+        elif walls is None:
+            walls = {(int(r), int(c)) for r, c in np.argwhere(wall_mask)}
         self.walls = walls if walls is not None else set()
+        self.wall_mask = wall_mask
+        # Wall mask padded with a one-cell blocked border, so a single lookup at (r + 1, c + 1)
+        # covers both walls and leaving the grid.
+        self.blocked_mask = np.ones((self.rows + 2, self.cols + 2), dtype=np.bool_)
+        self.blocked_mask[1:-1, 1:-1] = wall_mask
         self.rewards = rewards if rewards is not None else []
+        if reward_rc is None:
+            reward_rc = np.asarray(self.rewards, dtype=np.int32).reshape(-1, 2)
+        self.reward_rc = reward_rc
+        self._n_rewards = len(reward_rc)
+        # Rendering index arrays and the static background: white cells with black walls.
+        self._reward_rows = self.reward_rc[:, 0].astype(np.intp)
+        self._reward_cols = self.reward_rc[:, 1].astype(np.intp)
+        self._base_colors = np.ones((self.rows, self.cols, 3))
+        self._base_colors[self.wall_mask] = 0.0
         self.start = start
-        self.agent_pos = start
+        # Agent position kept as two ints; agent_pos builds the tuple on demand.
+        self._r, self._c = start
         self.current_reward = 0
+        # Grid-specialized step function, generated on the first reset (or step).
+        self._step_spec = None
 
     def reset(self):
         """Resets the agent to the starting position."""
-        self.agent_pos = self.start
+        if self._step_spec is None:
+            self._step_spec = _specialized_step(self.wall_mask, self.reward_rc)
+        self._r, self._c = self.start
         self.current_reward = 0
-        return (self.agent_pos, self.current_reward)
+        return (self.start, self.current_reward)
+
+    @property
+    def agent_pos(self):
+        """Current (row, col) position of the agent."""
+        return (self._r, self._c)
 
     def step(self, action):
         """
         Takes an action and updates the agent's position.
-        action: one of "up", "down", "left", "right".
+        action: an Action (or its integer value); any other code raises IndexError.
         Returns: (new_state, reward, done)
         """
-        r, c = self.agent_pos
-        new_r, new_c = r, c
+        if self._step_spec is None:
+            self._step_spec = _specialized_step(self.wall_mask, self.reward_rc)
+        self._r, self._c, reward, self.current_reward, done = self._step_spec(
+            self._r, self._c, action, self.current_reward)
+        return ((self._r, self._c), self.current_reward), reward, done
 
-        if action == "up":
-            new_r -= 1
-        elif action == "down":
-            new_r += 1
-        elif action == "left":
-            new_c -= 1
-        elif action == "right":
-            new_c += 1
-        else:
-            raise ValueError("Invalid action. Choose from 'up', 'down', 'left', or 'right'.")
+    def step_into(self, action, out):
+        """
+        Same as step, but writes (row, col, current_reward, reward, done) into out, a caller-owned
+        integer array of length 5 that can be reused across steps, instead of building tuples.
+        Returns out.
+        """
+        if self._step_spec is None:
+            self._step_spec = _specialized_step(self.wall_mask, self.reward_rc)
+        self._r, self._c, reward, self.current_reward, done = self._step_spec(
+            self._r, self._c, action, self.current_reward)
+        out[0] = self._r
+        out[1] = self._c
+        out[2] = self.current_reward
+        out[3] = reward
+        out[4] = done
+        return out
 
-        # Check grid boundaries; if out of bounds, remain in the same position.
-        if new_r < 0 or new_r >= self.rows or new_c < 0 or new_c >= self.cols:
-            new_r, new_c = r, c
+    def rollout(self, actions):
+        """
+        Takes a whole sequence of actions with a single call into compiled code.
+        actions: 1-D integer array of Action values
+        Returns: (n_steps, 5) int32 array of (row, col, current_reward, reward, done) per step taken;
+        stops after the step that collects the last reward.
+        """
+        actions = _check_actions(actions)
+        out = np.empty((len(actions), 5), dtype=np.int32)
+        n = _rollout_jit(self._r, self._c, self.current_reward, actions, self.blocked_mask,
+                         self.reward_rc, out)
+        if n:
+            self._r, self._c, self.current_reward = (int(v) for v in out[n - 1, :3])
+        return out[:n]
+
+    def build_transition_tensors(self):
+        """
+        Precomputes the deterministic MDP over encoded states s = (r * cols + c) * (n_rewards + 1) + k,
+        where k is the number of rewards collected (the same encoding as agent.encode).
+        Returns: (next_state, reward, terminal), each of shape (n_states, 4): int32 next-state indices,
+        float32 rewards, and booleans marking transitions after which the episode is over.
+        States with every reward collected are absorbing, with zero reward.
+        """
+        n_rewards = self._n_rewards
+        n_rc = n_rewards + 1
+        R, C, K = (x.ravel() for x in np.meshgrid(np.arange(self.rows), np.arange(self.cols), np.arange(n_rc),
+                                                  indexing='ij'))
+        n_states = R.size
+        next_state = np.empty((n_states, len(_DELTAS)), dtype=np.int32)
+        reward = np.zeros((n_states, len(_DELTAS)), dtype=np.float32)
+        terminal = np.zeros((n_states, len(_DELTAS)), dtype=np.bool_)
 
-        # Check if the new position is a wall; if so, don't move.
-        if (new_r, new_c) in self.walls:
-            new_r, new_c = r, c
+        active = K < n_rewards
+        # Target reward per state; finished states (and grids without rewards) have none.
+        target = np.zeros((n_states, 2), dtype=self.reward_rc.dtype)
+        target[active] = self.reward_rc[K[active]]
+        for a, (dr, dc) in enumerate(_DELTAS):
+            # Same movement rule as step: stay in place when blocked by a wall or the border.
+            NR, NC = R + dr, C + dc
+            blocked = self.blocked_mask[NR + 1, NC + 1] | ~active
+            NR = np.where(blocked, R, NR)
+            NC = np.where(blocked, C, NC)
+            hit = active & (NR == target[:, 0]) & (NC == target[:, 1])
+            NK = K + hit
+            next_state[:, a] = (NR * self.cols + NC) * n_rc + NK
+            reward[:, a] = hit
+            terminal[:, a] = NK >= n_rewards
+        return next_state, reward, terminal
 
-        self.agent_pos = (new_r, new_c)
+    def value_iteration(self, gamma=0.9, tol=1e-6, max_iters=1000):
+        """
+        Solves the gridworld MDP by value iteration on the precomputed transition tensors.
+        Returns: (V, Q) with V of shape (n_states,) and Q of shape (n_states, 4), indexed by encoded state.
+        """
+        next_state, reward, terminal = self.build_transition_tensors()
+        V = np.zeros(len(next_state))
+        Q = np.zeros(next_state.shape)
+        for _ in range(max_iters):
+            Q = reward + gamma * np.where(terminal, 0.0, V[next_state])
+            V_new = Q.max(axis=1)
+            converged = np.abs(V_new - V).max() < tol
+            V = V_new
+            if converged:
+                break
+        return V, Q
 
-        # Get reward if the agent is on the current reward square.
-        if self.rewards[self.current_reward] == self.agent_pos:
-            reward = 1
-            self.current_reward += 1
-        else:
-            reward = 0
+    def build_transition_matrix(self):
+        """
+        Sparse form of build_transition_tensors for linear-algebra methods.
+        Returns: (P, reward) where P is a CSR matrix of shape (n_states * 4, n_states) whose row s * 4 + a
+        has a single 1 at the next state of (s, a), and reward is the (n_states, 4) reward array.
+        Transitions that end the episode have an empty row, so nothing is bootstrapped past them.
+        """
+        import scipy.sparse as sp
+        next_state, reward, terminal = self.build_transition_tensors()
+        n_states, n_actions = next_state.shape
+        rows = np.flatnonzero(~terminal.ravel())
+        P = sp.csr_matrix((np.ones(len(rows)), (rows, next_state.ravel()[rows])),
+                          shape=(n_states * n_actions, n_states))
+        return P, reward
 
-        # Check if all the rewards are collected.
-        done = self.current_reward >= len(self.rewards)
+    def policy_evaluate(self, pi, gamma=0.9):
+        """
+        Computes V^pi exactly by solving (I - gamma * P_pi) V = r_pi.
+        pi: (n_states,) action index per encoded state, e.g. QLearningAgent.policy()
+        Returns: V of shape (n_states,)
+        """
+        import scipy.sparse as sp
+        from scipy.sparse.linalg import spsolve
+        P, reward = self.build_transition_matrix()
+        n_states, n_actions = reward.shape
+        pi = np.asarray(pi)
+        P_pi = P[np.arange(n_states) * n_actions + pi]
+        r_pi = reward[np.arange(n_states), pi]
+        return spsolve(sp.identity(n_states, format='csr') - gamma * P_pi, r_pi)
 
-        return (self.agent_pos, self.current_reward), reward, done
+    def _batch_dtypes(self):
+        """Narrowest dtypes for batched positions and reward counts: int8 and int16 when the grid fits."""
+        pos_dtype = np.int8 if max(self.rows, self.cols) <= np.iinfo(np.int8).max else np.int32
+        rc_dtype = np.int16 if self._n_rewards <= np.iinfo(np.int16).max else np.int32
+        return pos_dtype, rc_dtype
 
-    def render_plot(self, ax):
-        """Updates the matplotlib axis with the current gridworld state."""
-        ax.clear()  # Clear previous drawings
-
-        # Create a color grid: white for empty cells
-        grid_colors = np.ones((self.rows, self.cols, 3))
-        
-        # Color walls as black
-        for (r, c) in self.walls:
-            grid_colors[r, c] = [0.0, 0.0, 0.0]
-            
-        # Color rewards based on collection order:
-        for idx, pos in enumerate(self.rewards):
-            r, c = pos
-            if idx < self.current_reward:
-                grid_colors[r, c] = [0.8, 0.8, 0.8]  # Already collected (gray)
-            elif idx == self.current_reward:
-                grid_colors[r, c] = [0.6, 1.0, 0.6]  # Current target (light green)
-            else:
-                grid_colors[r, c] = [0.6, 0.6, 1.0]  # Future rewards (light blue)
-
-        # Display the grid
-        ax.imshow(grid_colors, interpolation='none')
+    def reset_batch(self, n_envs):
+        """
+        Resets n_envs independent copies of the environment for batched stepping.
+        Returns: (positions, current_rewards) arrays of shape (n_envs, 2) and (n_envs,), stored as
+        int8 and int16 when the grid allows it to keep the per-environment state small.
+        """
+        pos_dtype, rc_dtype = self._batch_dtypes()
+        self.positions = np.tile(np.asarray(self.start, dtype=pos_dtype), (n_envs, 1))
+        self.current_rewards = np.zeros(n_envs, dtype=rc_dtype)
+        return self.positions.copy(), self.current_rewards.copy()
+
+    def step_batch(self, actions):
+        """
+        Advances every batched environment by one step in a single vectorized pass.
+        actions: (n_envs,) array of integer action codes
+        Returns: ((positions, current_rewards), rewards, dones) for the step just taken.
+        Environments that finish are reset in place, ready for the next call.
+        """
+        actions = _check_actions(actions)
+        # Move in at least int16 so edge positions cannot wrap around before the bounds check.
+        new = self.positions.astype(np.promote_types(self.positions.dtype, np.int16)) + self._DELTAS[actions]
+        # Revert moves that leave the grid or walk into a wall.
+        blocked = self.blocked_mask[new[:, 0] + 1, new[:, 1] + 1]
+        new = np.where(blocked[:, None], self.positions, new).astype(self.positions.dtype)
+
+        # Collect each environment's current target reward; environments left finished by
+        # rollout_batch have no target and are reset below.
+        active = self.current_rewards < self._n_rewards
+        got = np.zeros(len(new), dtype=np.bool_)
+        got[active] = np.all(new[active] == self.reward_rc[self.current_rewards[active]], axis=1)
+        self.current_rewards += got
+        dones = self.current_rewards >= self._n_rewards
+        states = (new, self.current_rewards.copy())
+
+        # Auto-reset finished environments.
+        self.positions[:] = new
+        self.positions[dones] = self.start
+        self.current_rewards[dones] = 0
+        return states, got.astype(np.int32), dones
+
+    def step_batch_packed(self, states, actions):
+        """
+        Vectorized step over packed uint32 states (see pack_states), one 4-byte word per environment.
+        states: (n_envs,) uint32 array, actions: (n_envs,) array of integer action codes
+        Returns: (new_states, rewards, dones). Finished environments come back packed at the start
+        state, as in step_batch; the input array is not modified.
+        Only for grids of at most 256 x 256 cells with at most 0xFFFF rewards; raises ValueError otherwise.
+        """
+        if self.rows > 256 or self.cols > 256 or self._n_rewards > 0xFFFF:
+            raise ValueError(f"a {self.rows}x{self.cols} grid with {self._n_rewards} rewards is too large for packed states")
+        actions = _check_actions(actions)
+        states = np.asarray(states, dtype=np.uint32)
+        r = (states >> 24).astype(np.int32)
+        c = ((states >> 16) & 0xFF).astype(np.int32)
+        k = (states & 0xFFFF).astype(np.int32)
+
+        deltas = self._DELTAS[actions]
+        new_r = r + deltas[:, 0]
+        new_c = c + deltas[:, 1]
+        # Revert moves that leave the grid or walk into a wall.
+        blocked = self.blocked_mask[new_r + 1, new_c + 1]
+        new_r = np.where(blocked, r, new_r)
+        new_c = np.where(blocked, c, new_c)
+
+        active = k < self._n_rewards
+        target = np.zeros((len(k), 2), dtype=self.reward_rc.dtype)
+        target[active] = self.reward_rc[k[active]]
+        got = active & (new_r == target[:, 0]) & (new_c == target[:, 1])
+        k = k + got
+        dones = k >= self._n_rewards
+
+        new_states = (new_r.astype(np.uint32) << 24) | (new_c.astype(np.uint32) << 16) | k.astype(np.uint32)
+        start = np.uint32((self.start[0] << 24) | (self.start[1] << 16))
+        new_states = np.where(dones, start, new_states)
+        return new_states, got.astype(np.int32), dones
+
+    def init_plot(self, ax):
+        """Creates the persistent artists for render_plot on the given axis."""
+        ax.clear()
+        self._plot_ax = ax
+
+        # Grid image, updated in place by render_plot
+        self._im = ax.imshow(np.ones((self.rows, self.cols, 3)), interpolation='none')
 
         # Set grid lines
         ax.set_xticks(np.arange(-0.5, self.cols, 1), minor=True)
@@ -101,20 +447,202 @@ class GridWorld:
         ax.grid(which='minor', color='gray', linewidth=1)
         ax.tick_params(which='both', bottom=False, left=False, labelbottom=False, labelleft=False)
 
-        # Annotate each reward cell with its order number (if not yet collected)
-        for idx, pos in enumerate(self.rewards):
-            r, c = pos
-            if idx >= self.current_reward:
-                ax.text(c, r, f"{idx+1}", ha='center', va='center', color='black', fontsize=12)
-        
-        # Annotate the agent's current position with "A"
+        # One order-number label per reward cell, hidden once collected
+        self._reward_texts = [ax.text(c, r, f"{idx+1}", ha='center', va='center', color='black', fontsize=12)
+                              for idx, (r, c) in enumerate(self.rewards)]
+
+        # Agent marker "A", moved by render_plot
         r, c = self.agent_pos
-        ax.text(c, r, "A", ha='center', va='center', color='blue', fontsize=14, fontweight='bold')
-        
-        plt.draw()  # Update the figure
+        self._agent_text = ax.text(c, r, "A", ha='center', va='center', color='blue', fontsize=14, fontweight='bold')
+
+        # The text artists are blitted over a cached background holding the grid image and lines.
+        # A full redraw (reward collected, first show, resize) refreshes the background and draws them back on top.
+        self._artists = (*self._reward_texts, self._agent_text)
+        for artist in self._artists:
+            artist.set_animated(True)
+        canvas = ax.figure.canvas
+        if getattr(self, '_draw_cid', None) is not None:
+            self._draw_canvas.mpl_disconnect(self._draw_cid)
+        self._draw_canvas = canvas
+        self._draw_cid = canvas.mpl_connect('draw_event', self._on_draw)
+        self._drawn_reward = None
+
+    def _on_draw(self, event):
+        """Caches the static background after a full redraw and draws the animated artists on top."""
+        canvas = self._plot_ax.figure.canvas
+        self._background = canvas.copy_from_bbox(self._plot_ax.bbox)
+        for artist in self._artists:
+            self._plot_ax.draw_artist(artist)
+
+    def rollout_batch(self, actions_TK):
+        """
+        Advances the batched environments (see reset_batch) through T steps of actions in parallel.
+        actions_TK: (T, n_envs) array of action codes
+        Returns: (rewards, dones) arrays of shape (T, n_envs). Unlike step_batch, finished
+        environments are not reset; they stay done until reset_batch is called.
+        """
+        actions_TK = _check_actions(actions_TK)
+        rewards = np.zeros(actions_TK.shape, dtype=np.int32)
+        dones = np.zeros(actions_TK.shape, dtype=np.bool_)
+        rollout_many(self.positions, self.current_rewards, actions_TK, self.blocked_mask, self.reward_rc,
+                     rewards, dones)
+        return rewards, dones
+
+    def reset_batch_cuda(self, n_envs, threads_per_block=128):
+        """
+        Resets n_envs batched environments resident on the GPU. The grid arrays are copied to the
+        device once here; positions and reward counts then stay on the device across steps.
+        """
+        from numba import cuda
+        self._cuda_threads = threads_per_block
+        self._cuda_blocks = (n_envs + threads_per_block - 1) // threads_per_block
+        pos_dtype, rc_dtype = self._batch_dtypes()
+        self._d_positions = cuda.to_device(np.tile(np.asarray(self.start, dtype=pos_dtype), (n_envs, 1)))
+        self._d_current_rewards = cuda.to_device(np.zeros(n_envs, dtype=rc_dtype))
+        self._d_blocked_mask = cuda.to_device(self.blocked_mask)
+        self._d_reward_rc = cuda.to_device(self.reward_rc)
+        self._d_rewards = cuda.device_array(n_envs, dtype=np.int32)
+        self._d_dones = cuda.device_array(n_envs, dtype=np.bool_)
+
+    def step_batch_cuda(self, actions):
+        """
+        Advances the GPU-resident batch by one step (see reset_batch_cuda).
+        actions: (n_envs,) action codes, as a host array or a device array
+        Returns: (rewards, dones) as device arrays; nothing is copied back to the host.
+        Environments that finish are reset in place, as in step_batch.
+        Host arrays are validated like step_batch; device arrays are trusted, since the kernel cannot raise.
+        """
+        if not hasattr(actions, '__cuda_array_interface__'):
+            actions = _check_actions(actions)
+        from gridworld_cuda import step_kernel
+        step_kernel[self._cuda_blocks, self._cuda_threads](
+            self._d_positions, self._d_current_rewards, actions, self._d_blocked_mask, self._d_reward_rc,
+            self.start[0], self.start[1], self._d_rewards, self._d_dones)
+        return self._d_rewards, self._d_dones
+
+    def fetch_batch_cuda(self):
+        """Copies the GPU batch state back to the host, e.g. for rendering: (positions, current_rewards)."""
+        return self._d_positions.copy_to_host(), self._d_current_rewards.copy_to_host()
+
+    def render_plot(self, ax):
+        """
+        Updates the matplotlib axis with the current gridworld state.
+        Artists are created on the first call for an axis and then only updated. Frames that only move
+        the agent are blitted onto the axis, so no plt.pause is needed between frames.
+        Returns the updated artists.
+        """
+        if getattr(self, '_plot_ax', None) is not ax:
+            self.init_plot(ax)
+
+        # Move the agent marker to its current position
+        r, c = self.agent_pos
+        self._agent_text.set_position((c, r))
+
+        canvas = ax.figure.canvas
+        if self.current_reward != self._drawn_reward:
+            # Color rewards based on collection order: status 0 = collected, 1 = current target, 2 = future
+            grid_colors = self._base_colors.copy()
+            status = np.sign(np.arange(len(self._reward_rows)) - self.current_reward) + 1
+            grid_colors[self._reward_rows, self._reward_cols] = _REWARD_COLORS[status]
+            self._im.set_data(grid_colors)
 
+            # Show each reward's order number only while it is not yet collected
+            for idx, text in enumerate(self._reward_texts):
+                text.set_visible(idx >= self.current_reward)
+
+            # The background changed, so redraw the whole figure once; _on_draw re-caches it
+            self._drawn_reward = self.current_reward
+            canvas.draw()
+            canvas.flush_events()
+            return (self._im, *self._artists)
+
+        # Blit the moved marker over the cached background instead of redrawing the figure
+        canvas.restore_region(self._background)
+        for artist in self._artists:
+            ax.draw_artist(artist)
+        canvas.blit(ax.bbox)
+        canvas.flush_events()
+        return (self._im, *self._artists)
+
+
+def play_episode(env, policy, render_every=10, ax=None, verbose=False):
+    """
+    Plays one episode, asking policy(state) for each action; the episode also ends when it returns None.
+    When ax is given, the grid is rendered every render_every steps and once more at the end.
+    verbose prints every step, which is slow enough to dominate headless runs.
+    Returns the list of visited states, starting with the reset state.
+    """
+    if render_every < 1:
+        raise ValueError("render_every must be at least 1")
+    states = [env.reset()]
+    if ax is not None:
+        env.render_plot(ax)
+    done = False
+    n_steps = 0
+    while not done:
+        action = policy(states[-1])
+        if action is None:
+            break
+        state, reward, done = env.step(action)
+        states.append(state)
+        n_steps += 1
+        if verbose:
+            print(f"New state: {state} | Reward: {reward} | Done: {done}")
+        if ax is not None and n_steps % render_every == 0:
+            env.render_plot(ax)
+    if ax is not None:
+        env.render_plot(ax)
+    if verbose and done:
+        print("Episode finished")
+    return states
+
+def _read_key():
+    """Reads a single keypress without waiting for Enter (falls back to plain reads when stdin is not a terminal)."""
+    if not sys.stdin.isatty():
+        return sys.stdin.read(1)
+    try:
+        import msvcrt
+    except ImportError:
+        import termios
+        import tty
+        fd = sys.stdin.fileno()
+        old = termios.tcgetattr(fd)
+        try:
+            tty.setcbreak(fd)
+            return sys.stdin.read(1)
+        finally:
+            termios.tcsetattr(fd, termios.TCSADRAIN, old)
+    return msvcrt.getwch()
+
+def keyboard_policy(state):
+    """Reads the next action from the keyboard: w/a/s/d to move, q to quit."""
+    print("Action (w = up, s = down, a = left, d = right, q = quit): ", end="", flush=True)
+    while True:
+        key = _read_key().lower()
+        if key in ("q", ""):
+            print()
+            return None
+        if key in _KEY2ACT:
+            print(_KEY2ACT[key].name.lower())
+            return _KEY2ACT[key]
+        # Ignore the newlines left over from piped input
+        if not key.isspace():
+            print(f"\nInvalid key {key!r}. Use w, a, s, d or q: ", end="", flush=True)
+
+def _positive_int(text):
+    """argparse type for integers >= 1."""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
 
 def main():
+    parser = argparse.ArgumentParser(description="Play the gridworld from the keyboard or a scripted action list.")
+    parser.add_argument("--headless", action="store_true", help="run without any matplotlib rendering; with --actions, also without per-step output")
+    parser.add_argument("--actions", help="comma-separated scripted actions, e.g. right,right,down (default: read keys)")
+    parser.add_argument("--render-every", type=_positive_int, default=1, help="render every N steps")
+    args = parser.parse_args()
+
     # Walls in the grid
     walls = {(1, 2), (2, 1), (2, 2), (5, 0), (5, 2), (5, 3), (5, 4), (0, 6), (1, 6), (2, 6), (3, 6), (7,2), (7, 3), (5, 7), (6, 7)}
     # Reward squares in order of collection
@@ -122,30 +650,30 @@ def main():
 
     # Initialize the environment
     env = GridWorld(grid_size=(10, 10), walls=walls, rewards=rewards, start=(0, 0))
-    
-    # Enable interactive mode and create a figure and axis.
-    plt.ion()
-    fig, ax = plt.subplots(figsize=(10, 10))
-    env.render_plot(ax)
-    
-    done = False
-    while not done:
-        action = input("Enter action (up, down, left, right): ").strip().lower()
+
+    if args.actions is None:
+        policy = keyboard_policy
+    else:
         try:
-            state, reward, done = env.step(action)
-            print(f"New state: {state} | Reward: {reward} | Done: {done}")
-            env.render_plot(ax)
-            plt.pause(0.01)
-        except ValueError as e:
-            print(e)
-        
-        if done:
-            print("Episode finished")
-            break
+            scripted = iter([_STR2ACT[a.strip().lower()] for a in args.actions.split(",")])
+        except KeyError as e:
+            parser.error(f"invalid action {e.args[0]!r}; choose from 'up', 'down', 'left', or 'right'")
+        policy = lambda state: next(scripted, None)
+
+    ax = None
+    if not args.headless:
+        # Enable interactive mode and create a figure and axis.
+        plt.ion()
+        _, ax = plt.subplots(figsize=(10, 10))
+
+    # Scripted headless runs are for benchmarking, so they skip the per-step output too.
+    verbose = not (args.headless and args.actions is not None)
+    play_episode(env, policy, render_every=args.render_every, ax=ax, verbose=verbose)
 
-    plt.ioff()
-    plt.show()
+    if not args.headless:
+        plt.ioff()
+        plt.show()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,31 @@
+"""
+CUDA kernel for batched gridworld stepping, used by GridWorld.reset_batch_cuda and step_batch_cuda.
+Kept in its own module so numba.cuda is only imported when the GPU methods are used.
+"""
+
+from numba import cuda
+from gridworld import _transition
+
+# The same transition as GridWorld.step, compiled as a device function.
+_transition_device = cuda.jit(device=True)(_transition)
+
+@cuda.jit
+def step_kernel(positions, cur_rewards, actions, blocked_mask, reward_rc, start_r, start_c, rewards_out, dones_out):
+    """
+    Steps one environment per thread. Finished environments are reset to (start_r, start_c)
+    in place, as in GridWorld.step_batch.
+    """
+    k = cuda.grid(1)
+    if k >= positions.shape[0]:
+        return
+    new_r, new_c, reward, current_reward, done = _transition_device(positions[k, 0], positions[k, 1], actions[k],
+                                                                    blocked_mask, reward_rc, cur_rewards[k])
+    rewards_out[k] = reward
+    dones_out[k] = done
+    if done:
+        new_r = start_r
+        new_c = start_c
+        current_reward = 0
+    positions[k, 0] = new_r
+    positions[k, 1] = new_c
+    cur_rewards[k] = current_reward